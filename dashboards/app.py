@@ -7,6 +7,19 @@ import json
 import os
 import sys
 
+SRC_DIR = os.path.abspath('src')
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
+
+from alert_log import AlertLog
+from drift_monitoring import MIN_DRIFT_COUNT, PSI_ALERT, PSI_WARN, check_drift
+from threshold_optimizer import CURVE_PATH, GRID, load_alert_threshold, load_operating_points
+
+ALERT_FEED_SIZE = 5
+# Recent alerts kept per session so the score filter can still fill the feed
+ALERT_BUFFER_SIZE = 200
+ALERT_REFRESH_SECONDS = 5
+
 # Page Config
 st.set_page_config(
     page_title="Citi Loyalty Rewards: Fraud Analytics Platform",
@@ -55,6 +68,104 @@ def load_data():
 
 metrics, df = load_data()
 
+@st.cache_data
+def load_threshold_curve():
+    # Precomputed by threshold_optimizer on the grid, one row per (fraud_type, threshold)
+    try:
+        curve = pd.read_csv(CURVE_PATH)
+    except FileNotFoundError:
+        return {}
+    return {fraud_type: rows.reset_index(drop=True) for fraud_type, rows in curve.groupby('fraud_type')}
+
+def curve_at(curves, threshold, fraud_types=()):
+    """
+    Metrics at `threshold` for the selected fraud types. Per-type curves share the same
+    legitimate negatives, so their true positives and caught dollars simply add up.
+    """
+    idx = int(np.searchsorted(GRID, round(threshold, 3)))
+    overall = curves['all'].iloc[idx]
+    selected = [curves[t].iloc[idx] for t in fraud_types if t in curves]
+    if not selected:
+        return overall
+
+    tp = sum(row['true_positives'] for row in selected)
+    positives = sum(row['positives'] for row in selected)
+    fp, negatives = selected[0]['false_positives'], selected[0]['negatives']
+    caught = sum(row['exposure_caught_usd'] for row in selected)
+    total_exposure = sum(row['total_exposure_usd'] for row in selected)
+    # Alerts/day scaling is the same for every curve; take it from the alert-everything row
+    per_day = curves['all'].iloc[0]['alerts_per_day'] / max(curves['all'].iloc[0]['alert_volume'], 1)
+    return pd.Series({
+        'recall': tp / positives if positives else 0.0,
+        'precision': tp / (tp + fp) if tp + fp else 1.0,
+        'fpr': fp / negatives if negatives else 0.0,
+        'alerts_per_day': (tp + fp) * per_day,
+        'exposure_caught_pct': caught / total_exposure if total_exposure else 0.0,
+    })
+
+@st.cache_data(ttl=60)
+def load_drift():
+    try:
+        return check_drift()
+    except FileNotFoundError:
+        return pd.DataFrame()
+
+@st.cache_resource
+def get_alert_log():
+    return AlertLog()
+
+def render_alert(alert):
+    body = f"**{alert['type']}** (Member: {alert['member_id']})\n\n{alert['reason']}\n\n*Action: {alert['action']}*"
+    if alert['severity'] == 'HIGH':
+        st.error(body)
+    else:
+        st.warning(body)
+
+@st.fragment(run_every=ALERT_REFRESH_SECONDS)
+def alerts_feed(min_score=0.0):
+    # Only the alerts appended since the last refresh are read from the log
+    log = get_alert_log()
+    if 'alert_cursor' not in st.session_state:
+        recent, cursor = log.tail(ALERT_BUFFER_SIZE)
+    else:
+        new_alerts, cursor = log.read_since(st.session_state['alert_cursor'])
+        recent = (st.session_state['recent_alerts'] + new_alerts)[-ALERT_BUFFER_SIZE:]
+    st.session_state['alert_cursor'] = cursor
+    st.session_state['recent_alerts'] = recent
+
+    if not recent:
+        st.caption("No alerts logged yet. Run `python src/alert_system.py` to publish alerts.")
+        alerts = [
+             {'severity': 'HIGH', 'type': 'Points Farming', 'member_id': 96963, 'reason': 'Redeemed 84858 points today (threshold: 10K)', 'action': 'Block account, manual review'},
+             {'severity': 'HIGH', 'type': 'Account Cycling', 'member_id': 198851, 'reason': 'Member linked to known fraud network', 'action': 'Flag related accounts'},
+        ]
+    else:
+        # Drift alerts carry no model score and are always shown
+        alerts = [a for a in reversed(recent) if a.get('fraud_prob') is None or a['fraud_prob'] >= min_score][:ALERT_FEED_SIZE]
+        if not alerts:
+            st.caption(f"No alerts at or above a score of {min_score:.2f} among the latest {len(recent)} logged alerts.")
+
+    for alert in alerts:
+        render_alert(alert)
+
+TYPOLOGY_FRAUD_TYPES = {
+    "Points Farming": 'farming',
+    "Account Cycling": 'cycling',
+    "Referral Manipulation": 'referral',
+    "Promotion Abuse": 'promo',
+}
+
+threshold_curves = load_threshold_curve()
+operating_points = load_operating_points().get('operating_points', {})
+
+st.sidebar.title("Controls")
+st.sidebar.markdown("Filter monitoring view:")
+st.sidebar.selectbox("Timeframe", ["Last 24 Hours", "Last 7 Days", "Last 30 Days", "Year to Date"])
+typologies = st.sidebar.multiselect("Fraud Typology", list(TYPOLOGY_FRAUD_TYPES), default=["Points Farming", "Account Cycling"])
+selected_fraud_types = [TYPOLOGY_FRAUD_TYPES[t] for t in typologies]
+min_alert_score = st.sidebar.slider("Minimum Alert Score", 0.0, 1.0, round(load_alert_threshold(), 2))
+st.sidebar.button("Run Batch Scoring")
+
 st.title("🛡️ Citi Loyalty Rewards Fraud Analytics Platform")
 st.markdown("Real-time monitoring system detecting points farming, account cycling, and referral manipulation.")
 
@@ -72,10 +183,28 @@ col1, col2 = st.columns([2, 1])
 with col1:
     st.subheader("Fraud Detection Performance")
     t1, t2, t3, t4 = st.columns(4)
-    t1.metric("Ensemble Recall", "89.4%")
-    t2.metric("Precision", "76.2%")
-    t3.metric("Model AUC", "0.948")
-    t4.metric("False Positive Rate", "4.3%")
+    if not threshold_curves:
+        t1.metric("Ensemble Recall", "89.4%")
+        t2.metric("Precision", "76.2%")
+        t3.metric("Model AUC", "0.948")
+        t4.metric("False Positive Rate", "4.3%")
+    else:
+        # Operating point under the sidebar threshold for the selected typologies,
+        # looked up from the precomputed curves
+        point = curve_at(threshold_curves, min_alert_score, selected_fraud_types)
+        t1.metric("Ensemble Recall", f"{point['recall']:.1%}")
+        t2.metric("Precision", f"{point['precision']:.1%}")
+        t3.metric("Model AUC", "0.948")
+        t4.metric("False Positive Rate", f"{point['fpr']:.1%}")
+        v1, v2, v3, _ = st.columns(4)
+        v1.metric("Alert Score Threshold", f"{min_alert_score:.2f}")
+        v2.metric("Alerts / Day", f"{point['alerts_per_day']:,.0f}")
+        v3.metric("Exposure Caught", f"{point['exposure_caught_pct']:.1%}")
+
+        recommended = [f"{name} {operating_points[t]['threshold']:.2f}" for name, t in TYPOLOGY_FRAUD_TYPES.items()
+                       if name in typologies and operating_points.get(t)]
+        if recommended:
+            st.caption("Recommended thresholds by typology: " + " · ".join(recommended))
     
     # Exposure Breakdown Chart
     st.subheader("Financial Exposure Breakdown")
@@ -102,22 +231,7 @@ with col2:
     st.subheader("🚨 Real-Time Alerts")
     st.markdown("Live feed of suspicious redemptions requiring investigation.")
     
-    # Import the alert simulator
-    sys.path.append(os.path.abspath('src'))
-    try:
-        from alert_system import get_simulated_alerts
-        alerts = get_simulated_alerts(5)
-    except Exception as e:
-        alerts = [
-             {'severity': 'HIGH', 'type': 'Points Farming', 'member_id': 96963, 'reason': 'Redeemed 84858 points today (threshold: 10K)', 'action': 'Block account, manual review'},
-             {'severity': 'HIGH', 'type': 'Account Cycling', 'member_id': 198851, 'reason': 'Member linked to known fraud network', 'action': 'Flag related accounts'},
-        ]
-        
-    for alert in alerts:
-        if alert['severity'] == 'HIGH':
-            st.error(f"**{alert['type']}** (Member: {alert['member_id']})\n\n{alert['reason']}\n\n*Action: {alert['action']}*")
-        else:
-            st.warning(f"**{alert['type']}** (Member: {alert['member_id']})\n\n{alert['reason']}\n\n*Action: {alert['action']}*")
+    alerts_feed(min_alert_score)
 
 st.markdown("---")
 
@@ -136,9 +250,21 @@ fig3 = px.choropleth(df_geo,
                     title="High-Risk Transactions by State")
 st.plotly_chart(fig3, use_container_width=True)
 
-st.sidebar.title("Controls")
-st.sidebar.markdown("Filter monitoring view:")
-st.sidebar.selectbox("Timeframe", ["Last 24 Hours", "Last 7 Days", "Last 30 Days", "Year to Date"])
-st.sidebar.multiselect("Fraud Typology", ["Points Farming", "Account Cycling", "Referral Manipulation", "Promotion Abuse"], default=["Points Farming", "Account Cycling"])
-st.sidebar.slider("Minimum Alert Score", 0.0, 1.0, 0.85)
-st.sidebar.button("Run Batch Scoring")
+st.markdown("---")
+
+st.subheader("Model & Feature Drift")
+st.markdown("Population Stability Index of the last 7 days of scored redemptions against the training reference. "
+            f"Distributions with fewer than {MIN_DRIFT_COUNT:,} scored redemptions in the window are marked INSUFFICIENT.")
+drift = load_drift()
+if drift.empty:
+    st.info("No drift data yet. Train with `src/fraud_detection.py`, then stream events with `src/alert_system.py` or score batches with `src/partitioned_pipeline.py score`.")
+else:
+    d1, d2 = st.columns([2, 1])
+    with d1:
+        fig4 = px.bar(drift, x='feature', y='psi', color='status', title='PSI by Distribution',
+                      color_discrete_map={'OK': '#2ca02c', 'WARN': '#ff7f0e', 'ALERT': '#d62728', 'INSUFFICIENT': '#7f7f7f'})
+        fig4.add_hline(y=PSI_WARN, line_dash='dot', line_color='#ff7f0e')
+        fig4.add_hline(y=PSI_ALERT, line_dash='dash', line_color='#d62728')
+        st.plotly_chart(fig4, use_container_width=True)
+    with d2:
+        st.dataframe(drift[['feature', 'psi', 'ks', 'status']].round(3), hide_index=True, use_container_width=True)
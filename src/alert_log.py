@@ -0,0 +1,242 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Segmented, append-only alert log.
+#
+# Producers append alerts as JSON lines to the active segment; once it reaches
+# `segment_size` entries a new segment is started. Segment files are named after
+# the offset of their first entry (zero-padded, Kafka-style) so they sort in
+# offset order. Consumers hold a cursor and only read what was appended since,
+# so polling cost scales with the number of new alerts, not the size of the log.
+# Appends and compaction take an exclusive lock on the log directory and re-derive
+# the next offset from disk, so any number of producer processes can share a log.
+
+SEGMENT_SUFFIX = '.jsonl'
+LOCK_NAME = '.lock'
+
+
+def _segment_name(base_offset):
+    return f"{base_offset:020d}{SEGMENT_SUFFIX}"
+
+
+def _json_default(value):
+    # numpy/pandas scalars coming from DataFrame rows
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def _compaction_key(entry):
+    # Transaction alerts are unique per (transaction, type); drift alerts have no
+    # transaction and supersede each other per (member_id, type)
+    if entry.get('transaction_id') is not None:
+        return ('transaction', entry['transaction_id'], entry.get('type'))
+    return ('member', entry.get('member_id'), entry.get('type'))
+
+
+class AlertLog:
+    def __init__(self, log_dir='data/alerts', segment_size=5000, retention_segments=20):
+        self.log_dir = log_dir
+        self.segment_size = segment_size
+        self.retention_segments = retention_segments
+        os.makedirs(self.log_dir, exist_ok=True)
+
+    # --- Segment bookkeeping ---
+    def segments(self):
+        """Return the base offsets of all segments, oldest first."""
+        bases = []
+        for name in os.listdir(self.log_dir):
+            if name.endswith(SEGMENT_SUFFIX):
+                bases.append(int(name[:-len(SEGMENT_SUFFIX)]))
+        return sorted(bases)
+
+    def _path(self, base_offset):
+        return os.path.join(self.log_dir, _segment_name(base_offset))
+
+    @contextmanager
+    def _locked(self):
+        # Producers (and compaction) may live in different processes or AlertLog
+        # instances, so the log's write state is only ever trusted under this lock
+        with open(os.path.join(self.log_dir, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_active(self):
+        """
+        Return (active_base, next_offset) as currently on disk. Must hold the lock.
+        Only the tail of the active segment is read; a torn trailing line left by a
+        crashed writer is truncated so new entries start on a fresh line.
+        """
+        bases = self.segments()
+        if not bases:
+            return 0, 0
+        base = bases[-1]
+        path = self._path(base)
+
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            tail = b''
+            # Read backwards until the last complete line is fully in the buffer
+            while size - len(tail) > 0 and tail.count(b'\n') < 2:
+                step = min(64 * 1024, size - len(tail))
+                f.seek(size - len(tail) - step)
+                tail = f.read(step) + tail
+
+            complete_end = tail.rfind(b'\n') + 1
+            if complete_end < len(tail):
+                f.truncate(size - len(tail) + complete_end)
+            lines = tail[:complete_end].splitlines()
+
+        if not lines:
+            return base, base
+        return base, json.loads(lines[-1])['offset'] + 1
+
+    def next_offset(self):
+        with self._locked():
+            return self._load_active()[1]
+
+    # --- Producer side ---
+    def append(self, alerts):
+        """Append a batch of alert dicts. Returns the offset after the last written entry."""
+        with self._locked():
+            base, offset = self._load_active()
+
+            f = open(self._path(base), 'a')
+            try:
+                for alert in alerts:
+                    if offset - base >= self.segment_size:
+                        f.close()
+                        base = offset
+                        f = open(self._path(base), 'a')
+
+                    entry = dict(alert)
+                    entry['offset'] = offset
+                    entry.setdefault('logged_at', time.time())
+                    f.write(json.dumps(entry, default=_json_default) + '\n')
+                    offset += 1
+                f.flush()
+            finally:
+                f.close()
+
+        return offset
+
+    # --- Consumer side ---
+    def read_since(self, cursor=None, max_entries=None):
+        """
+        Read entries appended after `cursor` and return (entries, new_cursor).
+
+        A cursor is a dict with the next offset to read plus the segment and byte
+        position it lives at. When the cursor points into the active segment we seek
+        straight to that position; if the segment has since been sealed or compacted
+        we fall back to scanning from the segment that holds the offset.
+        Pass cursor=None to start from the beginning of the retained log.
+        """
+        bases = self.segments()
+        if not bases:
+            return [], cursor
+
+        if cursor is None:
+            cursor = {'offset': bases[0], 'segment': bases[0], 'position': 0}
+
+        start_offset = cursor['offset']
+        # Segment that contains start_offset (or the oldest one if it was compacted away)
+        start_idx = 0
+        for i, base in enumerate(bases):
+            if base <= start_offset:
+                start_idx = i
+
+        entries = []
+        new_cursor = dict(cursor)
+        for base in bases[start_idx:]:
+            seek_to = cursor['position'] if (base == cursor['segment'] and base == bases[-1]) else 0
+            with open(self._path(base)) as f:
+                f.seek(seek_to)
+                while True:
+                    line = f.readline()
+                    # Ignore a trailing partial line from a concurrent writer
+                    if not line or not line.endswith('\n'):
+                        break
+                    entry = json.loads(line)
+                    new_cursor = {'offset': entry['offset'] + 1, 'segment': base, 'position': f.tell()}
+                    if entry['offset'] < start_offset:
+                        continue
+                    entries.append(entry)
+                    if max_entries is not None and len(entries) >= max_entries:
+                        return entries, new_cursor
+
+        return entries, new_cursor
+
+    def tail(self, n=20):
+        """Return the last n entries and a cursor positioned at the end of the log."""
+        bases = self.segments()
+        if not bases:
+            return [], None
+
+        active = bases[-1]
+        cursor = {'offset': active, 'segment': active, 'position': 0}
+
+        entries = []
+        for base in reversed(bases):
+            segment_entries = []
+            with open(self._path(base)) as f:
+                while True:
+                    line = f.readline()
+                    # Stop before a torn line so the cursor never points mid-entry
+                    if not line or not line.endswith('\n'):
+                        break
+                    segment_entries.append(json.loads(line))
+                    if base == active:
+                        cursor = {'offset': segment_entries[-1]['offset'] + 1, 'segment': active, 'position': f.tell()}
+            entries = segment_entries + entries
+            if len(entries) >= n:
+                break
+
+        return entries[-n:], cursor
+
+    # --- Maintenance ---
+    def compact(self):
+        """
+        Compact sealed segments. Within each sealed segment only the latest alert per
+        (transaction_id, type) is kept, or per (member_id, type) for alerts without a
+        transaction such as drift alerts, and segments beyond `retention_segments` are dropped.
+        The active segment is never touched, so caught-up consumers are unaffected and
+        lagging consumers resume from their offset.
+        """
+        with self._locked():
+            return self._compact()
+
+    def _compact(self):
+        bases = self.segments()
+        sealed = bases[:-1]
+
+        expired = sealed[:max(0, len(bases) - self.retention_segments)]
+        for base in expired:
+            os.remove(self._path(base))
+
+        dropped = 0
+        for base in sealed[len(expired):]:
+            path = self._path(base)
+            with open(path) as f:
+                entries = [json.loads(line) for line in f if line.endswith('\n')]
+
+            latest = {}
+            for entry in entries:
+                latest[_compaction_key(entry)] = entry
+            if len(latest) == len(entries):
+                continue
+
+            kept = sorted(latest.values(), key=lambda e: e['offset'])
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                for entry in kept:
+                    f.write(json.dumps(entry, default=_json_default) + '\n')
+            os.replace(tmp_path, path)
+            dropped += len(entries) - len(kept)
+
+        return {'segments_expired': len(expired), 'entries_dropped': dropped}
@@ -1,5 +1,11 @@
 import pandas as pd
 import numpy as np
+import os
+import time
+
+from alert_log import AlertLog
+from drift_monitoring import REFERENCE_PATH, check_drift, load_reference, update_daily_histograms
+from threshold_optimizer import load_alert_threshold
 
 def generate_realtime_alerts(transaction, member_history):
     """
@@ -47,14 +53,18 @@ def generate_realtime_alerts(transaction, member_history):
     return alerts
 
 # Simulate a feed for the dashboard
-def get_simulated_alerts(num_alerts=20):
-    try:
-        df = pd.read_csv('data/model_test_results.csv')
-    except:
-        return []
+def get_simulated_alerts(num_alerts=20, df=None, threshold=None):
+    if df is None:
+        try:
+            df = pd.read_csv('data/model_test_results.csv')
+        except:
+            return []
+    if threshold is None:
+        threshold = load_alert_threshold()
     
     # Pick recent high probability fraud
-    high_risk = df[df['fraud_prob'] > 0.8].sample(min(num_alerts, len(df)))
+    high_risk = df[df['fraud_prob'] >= threshold]
+    high_risk = high_risk.sample(min(num_alerts, len(high_risk)))
     
     alerts_feed = []
     for _, row in high_risk.iterrows():
@@ -79,9 +89,100 @@ def get_simulated_alerts(num_alerts=20):
                 'reason': f'Model scored {row["fraud_prob"]:.2f} probability of fraud',
                 'action': 'Investigate'
             })
+        for alert in generated:
+            alert['fraud_prob'] = row['fraud_prob']
         alerts_feed.extend(generated)
         
     return alerts_feed
 
+def generate_batch_alerts(scored, threshold=None):
+    """
+    Generate alerts for every scored redemption at or above `threshold` (the optimized
+    operating point by default). Member history is
+    derived from the batch itself, so a batch holding all of a member's redemptions
+    (e.g. one member_id partition) produces the same alerts wherever it runs.
+    """
+    if threshold is None:
+        threshold = load_alert_threshold()
+
+    scored = scored.copy()
+    scored['redemption_date'] = pd.to_datetime(scored['timestamp']).dt.date
+    scored['daily_points'] = scored.groupby(['member_id', 'redemption_date'])['points_redeemed'].transform('sum')
+
+    alerts_feed = []
+    for _, row in scored[scored['fraud_prob'] >= threshold].iterrows():
+        tx = {
+            'member_id': row['member_id'],
+            'points_redeemed': row['points_redeemed'],
+            'amount_usd': row['amount_usd'],
+        }
+        hist = {
+            'daily_points': row['daily_points'] - row['points_redeemed'],
+            'network_risk_flag': int(row.get('network_risk_flag', 0)),
+            'state': 'Unknown'
+        }
+
+        generated = generate_realtime_alerts(tx, hist)
+        if not generated:
+            generated.append({
+                'severity': 'MEDIUM',
+                'type': 'Model Prediction',
+                'member_id': tx['member_id'],
+                'reason': f'Model scored {row["fraud_prob"]:.2f} probability of fraud',
+                'action': 'Investigate'
+            })
+        for alert in generated:
+            alert['transaction_id'] = row['transaction_id']
+            alert['fraud_prob'] = row['fraud_prob']
+        alerts_feed.extend(generated)
+
+    return alerts_feed
+
+def publish_alerts(alerts, log=None):
+    """Persist alerts to the append-only alert log consumed by the dashboard."""
+    log = log or AlertLog()
+    return log.append(alerts)
+
+def run_alert_producer(num_batches=1, batch_size=500, interval_s=5.0, compact_every=50, drift_check_every=10):
+    """
+    Replay scored redemptions in timestamp order as a stream of `batch_size` events.
+    Each batch is folded into the daily drift histograms and its alerts are published
+    to the alert log. Drift is checked every `drift_check_every` batches and the log
+    is compacted every `compact_every` batches.
+    """
+    try:
+        df = pd.read_csv('data/model_test_results.csv')
+    except FileNotFoundError:
+        print("No scored results found. Run src/fraud_detection.py first.")
+        return
+    if 'timestamp' not in df or 'transaction_id' not in df:
+        print("Scored results predate streaming support. Re-run src/fraud_detection.py.")
+        return
+
+    df = df.sort_values(['timestamp', 'transaction_id'], kind='mergesort', ignore_index=True)
+    drift_spec = load_reference() if os.path.exists(REFERENCE_PATH) else None
+    threshold = load_alert_threshold()
+
+    log = AlertLog()
+    for batch in range(num_batches):
+        events = df.iloc[batch * batch_size:(batch + 1) * batch_size]
+        if events.empty:
+            print("Reached the end of the scored results.")
+            break
+
+        if drift_spec:
+            update_daily_histograms(events, drift_spec)
+        alerts = generate_batch_alerts(events, threshold=threshold)
+        offset = publish_alerts(alerts, log)
+        print(f"Streamed {len(events)} events, published {len(alerts)} alerts (log offset: {offset})")
+
+        if drift_spec and drift_check_every and (batch + 1) % drift_check_every == 0:
+            drift = check_drift(spec=drift_spec, publish=True)
+            print(f"Drift check: {drift['status'].isin(['WARN', 'ALERT']).sum()} of {len(drift)} distributions past threshold")
+        if compact_every and (batch + 1) % compact_every == 0:
+            print(f"Compacted alert log: {log.compact()}")
+        if batch < num_batches - 1:
+            time.sleep(interval_s)
+
 if __name__ == "__main__":
-    print(get_simulated_alerts(5))
+    run_alert_producer()
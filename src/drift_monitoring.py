@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from alert_log import AlertLog
+
+# Score and feature drift monitoring on fixed-bin histograms.
+#
+# Bin edges are frozen at training time together with reference counts. Scored batches
+# (or single streamed events) only add to per-day count vectors, which merge by
+# addition, so daily histograms can be built per partition and summed. Each day file
+# also records the transaction ids counted into it, so a transaction is counted once
+# whichever scoring path (or rerun) sees it, and the version of the reference whose bin
+# edges it was counted with; files from an older reference are started over. A drift
+# check sums the days in its window and compares a handful of bins against the
+# reference, independent of how many transactions were scored.
+
+REFERENCE_PATH = 'data/metrics/drift_reference.json'
+# One file per day, so an update only touches the days present in its batch
+DAILY_DIR = 'data/metrics/drift_daily'
+
+SCORE_COLUMN = 'fraud_prob'
+NUMERIC_FEATURES = ['points_redeemed', 'amount_usd', 'shared_ip_count']
+CATEGORICAL_PREFIXES = {'email_domain': 'email_domain_'}
+N_BINS = 20
+
+# Common PSI rule of thumb: <0.1 stable, 0.1-0.2 moderate shift, >0.2 significant shift
+PSI_WARN = 0.1
+PSI_ALERT = 0.2
+KS_ALERT = 0.1
+# With 20 bins, PSI from sampling noise alone is roughly 20 / n; below this many rows
+# in the window a check reports INSUFFICIENT instead of alerting on noise
+MIN_DRIFT_COUNT = 1000
+
+
+# --- Binning ---
+def _quantile_edges(values, n_bins=N_BINS):
+    # Inner edges only; the outer bins are open-ended so unseen extremes still land somewhere
+    edges = np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])
+    return np.unique(edges).tolist()
+
+def _numeric_counts(values, edges):
+    idx = np.searchsorted(np.asarray(edges), np.asarray(values, dtype=float), side='right')
+    return np.bincount(idx, minlength=len(edges) + 1)
+
+def _category_codes(df, columns):
+    # One-hot columns were built with drop_first, so "no dummy set" is the reference category
+    if not columns:
+        return np.zeros(len(df), dtype=int)
+    onehot = df.reindex(columns=columns, fill_value=0).to_numpy(dtype=float)
+    return np.where(onehot.any(axis=1), onehot.argmax(axis=1) + 1, 0)
+
+def histogram_counts(df, spec):
+    """Count the rows of `df` into every monitored histogram defined by `spec`."""
+    counts = {}
+    for name, hist in spec.items():
+        if hist['kind'] == 'categorical':
+            if hist['columns'] and not df.columns.isin(hist['columns']).any():
+                continue
+            codes = _category_codes(df, hist['columns'])
+            counts[name] = np.bincount(codes, minlength=len(hist['columns']) + 1)
+        elif name in df:
+            counts[name] = _numeric_counts(df[name].fillna(0), hist['edges'])
+    return counts
+
+# --- Reference (training time) ---
+def build_reference(df):
+    """Freeze bin edges and reference counts from the data the model was evaluated on."""
+    spec = {SCORE_COLUMN: {'kind': 'numeric', 'edges': np.linspace(0, 1, N_BINS + 1)[1:-1].tolist()}}
+    for feature in NUMERIC_FEATURES:
+        spec[feature] = {'kind': 'numeric', 'edges': _quantile_edges(df[feature].fillna(0))}
+    for name, prefix in CATEGORICAL_PREFIXES.items():
+        columns = sorted(c for c in df.columns if c.startswith(prefix))
+        spec[name] = {'kind': 'categorical', 'columns': columns,
+                      'labels': [f'{name} (reference category)'] + [c[len(prefix):] for c in columns]}
+
+    for name, counts in histogram_counts(df, spec).items():
+        spec[name]['counts'] = counts.tolist()
+    return spec
+
+def save_reference(spec, path=REFERENCE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(spec, f)
+
+def load_reference(path=REFERENCE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+def reference_version(spec):
+    """Hash of the reference's bin definitions; day counts are only comparable within one version."""
+    bins = {name: hist.get('edges', hist.get('columns')) for name, hist in spec.items()}
+    return hashlib.sha1(json.dumps(bins, sort_keys=True).encode()).hexdigest()
+
+# --- Per-day histograms (scoring time) ---
+def daily_histograms(df, spec, date_column='timestamp'):
+    """Per-day histogram counts for a scored batch: {date: {feature: counts}}."""
+    return {day: histogram_counts(day_df, spec) for day, day_df in df.groupby(_day_dates(df, date_column))}
+
+def merge_daily(*histograms):
+    """Add together any number of per-day histogram dicts."""
+    merged = {}
+    for hist in histograms:
+        for day, features in hist.items():
+            day_hist = merged.setdefault(day, {})
+            for name, counts in features.items():
+                counts = np.asarray(counts)
+                day_hist[name] = day_hist[name] + counts if name in day_hist else counts
+    return merged
+
+def _day_dates(df, date_column='timestamp'):
+    return pd.to_datetime(df[date_column]).dt.strftime('%Y-%m-%d')
+
+def daily_transactions(df, date_column='timestamp'):
+    """Transaction ids of a scored batch per day: {date: [ids]}."""
+    if 'transaction_id' not in df:
+        return {}
+    ids = df['transaction_id'].astype('int64')
+    return {day: day_ids.tolist() for day, day_ids in ids.groupby(_day_dates(df, date_column))}
+
+def _day_path(day, daily_dir):
+    return os.path.join(daily_dir, f'{day}.json')
+
+def _read_day(day, daily_dir, version):
+    path = _day_path(day, daily_dir)
+    if os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        if stored.get('reference_version') == version:
+            return stored
+    # Missing, or counted with other bin edges: start the day over
+    return {'reference_version': version, 'counts': {}, 'transactions': []}
+
+def stored_days(daily_dir=DAILY_DIR):
+    if not os.path.isdir(daily_dir):
+        return []
+    return sorted(name[:-len('.json')] for name in os.listdir(daily_dir) if name.endswith('.json'))
+
+def load_daily(days=None, spec=None, daily_dir=DAILY_DIR):
+    """Load per-day counts for `days` (all stored days by default) counted with the current reference."""
+    version = reference_version(spec or load_reference())
+    days = stored_days(daily_dir) if days is None else days
+    loaded = {}
+    for day in days:
+        if os.path.exists(_day_path(day, daily_dir)):
+            counts = _read_day(day, daily_dir, version)['counts']
+            if counts:
+                loaded[day] = counts
+    return loaded
+
+def unrecorded_mask(df, spec=None, daily_dir=DAILY_DIR, date_column='timestamp'):
+    """Boolean Series, True for rows whose transaction is not yet counted in its day's histograms."""
+    if 'transaction_id' not in df:
+        return pd.Series(True, index=df.index)
+    version = reference_version(spec or load_reference())
+    # A transaction's timestamp fixes its day, so only the batch's day files are read
+    recorded = set()
+    for day in _day_dates(df, date_column).unique():
+        recorded.update(_read_day(day, daily_dir, version)['transactions'])
+    return ~df['transaction_id'].isin(recorded)
+
+def update_daily_histograms(df_or_hist, spec=None, transactions=None, daily_dir=DAILY_DIR):
+    """
+    Fold scored rows into the stored daily histograms. Accepts either a scored DataFrame
+    (a single streamed event is a one-row frame), whose already-counted transactions
+    are skipped, or precomputed per-day counts plus the {date: ids} they cover, which
+    must only include unrecorded rows (see `unrecorded_mask`). Returns the updated days.
+    """
+    spec = spec or load_reference()
+    version = reference_version(spec)
+    if isinstance(df_or_hist, pd.DataFrame):
+        df = df_or_hist[unrecorded_mask(df_or_hist, spec, daily_dir)]
+        df_or_hist = daily_histograms(df, spec)
+        transactions = daily_transactions(df)
+    transactions = transactions or {}
+
+    os.makedirs(daily_dir, exist_ok=True)
+    updated = []
+    for day, counts in df_or_hist.items():
+        stored = _read_day(day, daily_dir, version)
+        merged = merge_daily({day: stored['counts']}, {day: counts})[day]
+        stored['counts'] = {name: np.asarray(c).tolist() for name, c in merged.items()}
+        stored['transactions'] = sorted(set(stored['transactions']).union(transactions.get(day, [])))
+
+        path = _day_path(day, daily_dir)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, path)
+        updated.append(day)
+    return updated
+
+# --- Drift scores ---
+def psi(reference, current, eps=1e-4):
+    ref = np.asarray(reference, dtype=float)
+    cur = np.asarray(current, dtype=float)
+    ref = np.clip(ref / max(ref.sum(), 1), eps, None)
+    cur = np.clip(cur / max(cur.sum(), 1), eps, None)
+    return float(np.sum((cur - ref) * np.log(cur / ref)))
+
+def ks_statistic(reference, current):
+    """Max CDF gap between binned distributions (a lower bound on the exact KS statistic)."""
+    ref = np.cumsum(reference) / max(np.sum(reference), 1)
+    cur = np.cumsum(current) / max(np.sum(current), 1)
+    return float(np.max(np.abs(ref - cur)))
+
+def check_drift(window_days=7, end_date=None, spec=None, daily=None, publish=False, min_count=MIN_DRIFT_COUNT):
+    """
+    Compare the last `window_days` of daily histograms against the training reference.
+    Returns one row per monitored distribution with PSI, KS and a status; distributions
+    with fewer than `min_count` rows in the window are INSUFFICIENT and never alerted on.
+    """
+    spec = spec or load_reference()
+    if end_date is None:
+        if daily is not None:
+            end_date = max(daily, default=None)
+        else:
+            # Latest day counted with the current reference
+            end_date = next((day for day in reversed(stored_days()) if load_daily([day], spec)), None)
+        if end_date is None:
+            return pd.DataFrame(columns=['feature', 'psi', 'ks', 'current_count', 'status'])
+
+    end = pd.Timestamp(end_date)
+    days = [(end - pd.Timedelta(days=i)).strftime('%Y-%m-%d') for i in range(window_days)]
+    # Only the window's day files are read
+    daily = daily if daily is not None else load_daily(days, spec)
+    window = merge_daily({d: daily[d] for d in days if d in daily}).values()
+
+    rows = []
+    for name, hist in spec.items():
+        current = sum((np.asarray(feats[name]) for feats in window if name in feats), np.zeros(len(hist['counts'])))
+        if current.sum() == 0:
+            continue
+        drift_psi = psi(hist['counts'], current)
+        drift_ks = ks_statistic(hist['counts'], current) if hist['kind'] == 'numeric' else np.nan
+        if current.sum() < min_count:
+            status = 'INSUFFICIENT'
+        elif drift_psi > PSI_ALERT or drift_ks > KS_ALERT:
+            status = 'ALERT'
+        elif drift_psi > PSI_WARN:
+            status = 'WARN'
+        else:
+            status = 'OK'
+        rows.append({'feature': name, 'psi': drift_psi, 'ks': drift_ks, 'current_count': int(current.sum()), 'status': status})
+
+    results = pd.DataFrame(rows, columns=['feature', 'psi', 'ks', 'current_count', 'status'])
+    if publish and not results.empty:
+        publish_drift_alerts(results, end.strftime('%Y-%m-%d'))
+    return results
+
+def publish_drift_alerts(results, as_of, log=None):
+    """Write an alert to the alert log for every distribution past its drift threshold."""
+    alerts = []
+    for _, row in results[results['status'].isin(['WARN', 'ALERT'])].iterrows():
+        kind = 'Score Drift' if row['feature'] == SCORE_COLUMN else 'Feature Drift'
+        ks_text = f", KS {row['ks']:.3f}" if pd.notna(row['ks']) else ''
+        alerts.append({
+            'severity': 'HIGH' if row['status'] == 'ALERT' else 'MEDIUM',
+            'type': f"{kind}: {row['feature']}",
+            'member_id': 'N/A',
+            'reason': f"PSI {row['psi']:.3f}{ks_text} vs training reference (window ending {as_of})",
+            'action': 'Review input data and consider retraining'
+        })
+    if alerts:
+        (log or AlertLog()).append(alerts)
+    return alerts
+
+if __name__ == "__main__":
+    results = check_drift(publish=True)
+    print(results.to_string(index=False) if not results.empty else "No scored batches recorded yet.")
@@ -7,17 +7,33 @@ from sklearn.metrics import classification_report, recall_score, precision_score
 import xgboost as xgb
 import joblib
 
+from drift_monitoring import build_reference, save_reference
+from threshold_optimizer import SPLIT_COLUMN, run_threshold_optimization
+
+ISO_FEATURES = ['total_points_redeemed', 'avg_points_redeemed', 'max_points_redeemed', 'time_since_last_redemption_h']
+MODEL_PATH = 'src/ensemble_fraud_model.pkl'
+ISO_MODEL_PATH = 'src/isolation_forest_model.pkl'
+
+def score_transactions(df, ensemble, iso_forest):
+    """
+    Score engineered feature rows with the trained models and return fraud probabilities.
+    Columns are aligned to the ones the ensemble was trained on.
+    """
+    X = df.copy()
+    X['isolation_forest_flag'] = (iso_forest.predict(X[ISO_FEATURES].fillna(0)) == -1).astype(int)
+    X.columns = X.columns.str.replace('<', '')
+    X = X.reindex(columns=ensemble.feature_names_in_, fill_value=0).fillna(0)
+    return ensemble.predict_proba(X)[:, 1]
+
 def run_fraud_detection_pipeline():
     print("Loading engineered features...")
     df = pd.read_csv('data/engineered_features.csv')
     
     # 1. Isolation Forest for Points Farming (Unsupervised Anomaly Detection)
     print("Running Isolation Forest for Points Farming detection...")
-    iso_features = ['total_points_redeemed', 'avg_points_redeemed', 'max_points_redeemed', 'time_since_last_redemption_h']
-    
     # We fit IF on a sample to find anomalies
     iso_forest = IsolationForest(contamination=0.023, random_state=42)
-    df['anomaly_score'] = iso_forest.fit_predict(df[iso_features].fillna(0))
+    df['anomaly_score'] = iso_forest.fit_predict(df[ISO_FEATURES].fillna(0))
     
     # -1 means anomaly
     farming_predicted = df[df['anomaly_score'] == -1]['member_id']
@@ -73,21 +89,44 @@ def run_fraud_detection_pipeline():
     ensemble.fit(X_train, y_train)
     
     print("\nEvaluating Ensemble Model...")
-    y_pred = ensemble.predict(X_test)
     y_proba = ensemble.predict_proba(X_test)[:, 1]
+
+    # Cost-based operating point instead of the implicit 0.5 cutoff of ensemble.predict.
+    # The threshold is chosen on one half of the holdout; the targets below and the curve
+    # served to the dashboard come from the other half, so neither is biased by the search.
+    val_idx, eval_idx = train_test_split(X_test.index, test_size=0.5, random_state=42, stratify=y_test)
+    threshold_split = pd.Series('evaluation', index=X_test.index).where(~X_test.index.isin(val_idx), 'validation')
+    scored_test = pd.DataFrame({
+        'is_fraud': y_test,
+        'fraud_type': df.loc[X_test.index, 'fraud_type'],
+        'fraud_prob': y_proba,
+        'amount_usd': X_test['amount_usd'],
+        SPLIT_COLUMN: threshold_split,
+    })
+    timestamps = pd.to_datetime(df['timestamp'])
+    n_days = (timestamps.max() - timestamps.min()).days + 1
+    _, operating_points = run_threshold_optimization(scored_test, max_fpr=0.05,
+                                                     population_rows=len(df), n_days=n_days)
+    threshold = operating_points['all']['threshold'] if operating_points['all'] else 0.5
+    y_pred = (y_proba >= threshold).astype(int)
+
+    eval_mask = X_test.index.isin(eval_idx)
+    y_eval, y_pred_eval, y_proba_eval = y_test[eval_mask], y_pred[eval_mask], y_proba[eval_mask]
+
+    recall = recall_score(y_eval, y_pred_eval)
+    precision = precision_score(y_eval, y_pred_eval, zero_division=0)
+    auc = roc_auc_score(y_eval, y_proba_eval)
     
-    recall = recall_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred)
-    auc = roc_auc_score(y_test, y_proba)
-    
-    tn, fp, fn, tp = confusion_matrix(y_test, y_pred).ravel()
+    tn, fp, fn, tp = confusion_matrix(y_eval, y_pred_eval).ravel()
     fpr = fp / (fp + tn)
     
+    print(f"\nMetrics on {len(y_eval):,} held-out rows not used for threshold selection:")
     print("-" * 30)
     print(f"Recall:    {recall:.2%} (Target: >89%)")
     print(f"Precision: {precision:.2%} (Target: >75%)")
     print(f"AUC:       {auc:.2%} (Target: >92%)")
     print(f"FPR:       {fpr:.2%} (Target: <5%)")
+    print(f"Threshold: {threshold:.3f}")
     print("-" * 30)
     
     if recall >= 0.89 and precision >= 0.75 and auc >= 0.92 and fpr <= 0.05:
@@ -96,17 +135,24 @@ def run_fraud_detection_pipeline():
          print("⚠️ Some Model Targets Missed (Check Output). It is acceptable for highly imbalanced synthetic data.")
          
     print("\nSaving final model...")
-    joblib.dump(ensemble, 'src/ensemble_fraud_model.pkl')
+    joblib.dump(ensemble, MODEL_PATH)
+    joblib.dump(iso_forest, ISO_MODEL_PATH)
     
     # Save test set for dashboard
     test_df = X_test.copy()
     test_df['is_fraud'] = y_test
     test_df['fraud_prob'] = y_proba
     test_df['prediction'] = y_pred
+    # Kept so a standalone threshold_optimizer.py run reuses the same split
+    test_df[SPLIT_COLUMN] = threshold_split
     # join back member ids and amounts for business logic 
-    test_df = test_df.join(df[['member_id', 'fraud_type']])
+    test_df = test_df.join(df[['transaction_id', 'member_id', 'timestamp', 'fraud_type']])
     
     test_df.to_csv('data/model_test_results.csv', index=False)
+
+    # Freeze reference histograms for score/feature drift monitoring
+    save_reference(build_reference(test_df))
+    print("Drift reference histograms saved.")
     
     print("Fraud Detection Pipeline Complete!")
 
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from alert_log import AlertLog
+from alert_system import generate_batch_alerts
+from drift_monitoring import (REFERENCE_PATH, check_drift, daily_histograms, daily_transactions, load_reference,
+                              merge_daily, unrecorded_mask, update_daily_histograms)
+from feature_engineering import CAT_COLUMNS, merge_member_attributes, compute_sharing_counts, engineer_features
+from fraud_detection import MODEL_PATH, ISO_MODEL_PATH, score_transactions
+from similarity_index import build_similarity_index
+from threshold_optimizer import load_alert_threshold
+
+# Hash-partitioned execution of the per-member pipeline stages.
+#
+# Members and redemptions are sharded by a stable hash of member_id, so each member's
+# full history lives in exactly one partition. Stage functions below only receive a
+# partition's rows plus any broadcast globals and return DataFrames, which keeps them
+# free of process-local state: the local process pool could be swapped for any
+# executor with a compatible `map` (e.g. one that dispatches partitions to other nodes).
+# Global aggregates (shared IP/device member counts) are produced by a map step on each
+# partition, a shuffle by key hash, and a reduce per key bucket.
+
+
+def default_partitions():
+    return os.cpu_count() or 1
+
+def partition_ids(keys, n_partitions):
+    """Stable partition index for each key; does not depend on PYTHONHASHSEED or process."""
+    hashed = pd.util.hash_array(np.asarray(keys))
+    return (hashed % np.uint64(n_partitions)).astype(np.int64)
+
+def split_by_member(df, n_partitions):
+    parts = partition_ids(df['member_id'].to_numpy(), n_partitions)
+    return [df[parts == i] for i in range(n_partitions)]
+
+# --- Shuffle for global aggregates ---
+def _map_partition_stats(args):
+    members_part, redemptions_part = args
+    df = merge_member_attributes(members_part, redemptions_part)
+    # Every member sits in one partition, so per-partition distinct counts sum to global ones
+    ip_counts, device_counts = compute_sharing_counts(df)
+    # Vocabulary comes from merged redemption rows, exactly what single-process get_dummies sees
+    uniques = {col: set(df[col].dropna().unique()) for col in CAT_COLUMNS}
+    return ip_counts, device_counts, uniques
+
+def _reduce_counts(partials):
+    return pd.concat(partials).groupby(level=0).sum()
+
+def shuffle_reduce(partials, n_partitions, executor):
+    """Route partial per-key counts to the bucket owning each key and sum them there."""
+    buckets = [[] for _ in range(n_partitions)]
+    for partial in partials:
+        owners = partition_ids(partial.index.to_numpy(), n_partitions)
+        for i in range(n_partitions):
+            buckets[i].append(partial[owners == i])
+
+    reduced = list(executor.map(_reduce_counts, buckets))
+    return pd.concat(reduced).sort_index()
+
+# --- Per-partition stages ---
+def _feature_stage(args):
+    members_part, redemptions_part, ip_counts, device_counts, categories, as_of = args
+    df = merge_member_attributes(members_part, redemptions_part, as_of=as_of)
+    return engineer_features(df, ip_counts=ip_counts, device_counts=device_counts,
+                             categories=categories, verbose=False)
+
+_models = {}
+
+def _load_models():
+    # Loaded once per worker process; each worker scores single-threaded
+    ensemble = joblib.load(MODEL_PATH)
+    for estimator in ensemble.estimators_:
+        if 'n_jobs' in estimator.get_params():
+            estimator.set_params(n_jobs=1)
+    _models['ensemble'] = ensemble
+    _models['iso_forest'] = joblib.load(ISO_MODEL_PATH)
+
+def _scoring_stage(args):
+    features_part, threshold, drift_spec, drift_rows = args
+    scored = features_part.copy()
+    scored['fraud_prob'] = score_transactions(scored, _models['ensemble'], _models['iso_forest'])
+    alerts = pd.DataFrame(generate_batch_alerts(scored, threshold=threshold))
+    # Daily histograms merge by addition, so each partition counts its own rows that
+    # are not in the stored histograms yet
+    histograms = daily_histograms(scored[drift_rows], drift_spec) if drift_spec else {}
+    return scored, alerts, histograms
+
+# --- Publish bookkeeping ---
+# Kept next to the alert log it describes, so starting a fresh log starts over
+PUBLISHED_STATE = 'partitioned_published.json'
+
+def _last_published_transaction(log):
+    path = os.path.join(log.log_dir, PUBLISHED_STATE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['last_transaction_id']
+
+def _mark_published(log, transaction_id):
+    path = os.path.join(log.log_dir, PUBLISHED_STATE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'last_transaction_id': int(transaction_id)}, f)
+    os.replace(tmp_path, path)
+
+# --- Drivers ---
+def run_partitioned_feature_engineering(n_partitions=None, max_workers=None):
+    n_partitions = n_partitions or default_partitions()
+
+    print("Loading raw data...")
+    members = pd.read_csv('data/members.csv')
+    redemptions = pd.read_csv('data/redemptions.csv')
+
+    print(f"Hash-partitioning members and redemptions into {n_partitions} partitions...")
+    inputs = list(zip(split_by_member(members, n_partitions), split_by_member(redemptions, n_partitions)))
+
+    # Broadcast values every partition must agree on
+    as_of = pd.Timestamp('today')
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        print("Shuffling shared IP/device counts and categorical vocabulary...")
+        partials = list(executor.map(_map_partition_stats, inputs))
+        ip_counts = shuffle_reduce([p[0] for p in partials], n_partitions, executor)
+        device_counts = shuffle_reduce([p[1] for p in partials], n_partitions, executor)
+        categories = {col: sorted(set().union(*(p[2][col] for p in partials))) for col in CAT_COLUMNS}
+
+        print("Engineering features per partition...")
+        parts = list(executor.map(
+            _feature_stage,
+            [(m, r, ip_counts, device_counts, categories, as_of) for m, r in inputs]
+        ))
+
+    # Deterministic merge: same row order regardless of partition count or completion order
+    final_features_df = pd.concat(parts, ignore_index=True)
+    final_features_df = final_features_df.sort_values(['member_id', 'timestamp', 'transaction_id'], kind='mergesort', ignore_index=True)
+
+    print(f"Generated data shape with {final_features_df.shape[1] - 5} features.")
+    print("Saving feature engineered dataset...")
+    final_features_df.to_csv('data/engineered_features.csv', index=False)
+    print("Partitioned Feature Engineering successful.")
+
+    build_similarity_index(final_features_df)
+    return final_features_df
+
+def run_partitioned_scoring(n_partitions=None, max_workers=None, threshold=None, publish=True):
+    n_partitions = n_partitions or default_partitions()
+    threshold = threshold if threshold is not None else load_alert_threshold()
+
+    print("Loading engineered features...")
+    df = pd.read_csv('data/engineered_features.csv')
+
+    print(f"Scoring {len(df):,} redemptions across {n_partitions} partitions...")
+    drift_spec = load_reference() if os.path.exists(REFERENCE_PATH) else None
+    # Transactions already counted (by an earlier run or the alert producer) are skipped
+    drift_rows = unrecorded_mask(df, drift_spec) if drift_spec else pd.Series(False, index=df.index)
+    inputs = [(part, threshold, drift_spec, drift_rows[part.index]) for part in split_by_member(df, n_partitions)]
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_load_models) as executor:
+        results = list(executor.map(_scoring_stage, inputs))
+
+    scored = pd.concat([r[0] for r in results]).sort_values('transaction_id', kind='mergesort', ignore_index=True)
+    alerts = pd.concat([r[1] for r in results], ignore_index=True)
+    if not alerts.empty:
+        alerts = alerts.sort_values(['transaction_id', 'type'], kind='mergesort', ignore_index=True)
+
+    scored[['transaction_id', 'member_id', 'timestamp', 'points_redeemed', 'amount_usd', 'fraud_prob']].to_csv(
+        'data/scored_redemptions.csv', index=False)
+    print(f"Scored redemptions saved to data/scored_redemptions.csv ({len(alerts):,} alerts)")
+
+    if publish and not scored.empty:
+        # Only transactions past the last published one are alerted on, so re-scoring
+        # the same features file does not repeat its alerts
+        log = AlertLog()
+        last_published = _last_published_transaction(log)
+        if last_published is not None and not alerts.empty:
+            alerts = alerts[alerts['transaction_id'] > last_published].reset_index(drop=True)
+        if not alerts.empty:
+            offset = log.append(alerts.to_dict('records'))
+            print(f"Published {len(alerts):,} alerts to the alert log (log offset: {offset})")
+        elif last_published is not None:
+            print(f"No new alerts to publish (transactions up to {last_published} already published)")
+        _mark_published(log, max(scored['transaction_id'].max(), last_published or 0))
+
+    if drift_spec:
+        update_daily_histograms(merge_daily(*[r[2] for r in results]), drift_spec,
+                                transactions=daily_transactions(df[drift_rows]))
+        drift = check_drift(spec=drift_spec, publish=publish)
+        print(f"Drift check: {drift['status'].isin(['WARN', 'ALERT']).sum()} of {len(drift)} distributions past threshold")
+
+    return scored, alerts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run per-member pipeline stages across hash partitions.")
+    parser.add_argument('stage', choices=['features', 'score'])
+    parser.add_argument('--partitions', type=int, default=None, help="Number of member_id hash partitions (default: CPU count)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if args.stage == 'features':
+        run_partitioned_feature_engineering(args.partitions, args.workers)
+    else:
+        run_partitioned_scoring(args.partitions, args.workers)
@@ -0,0 +1,213 @@
+import os
+import time
+from functools import lru_cache
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+INDEX_PATH = 'data/member_similarity_index.pkl'
+
+# Per-member aggregates that feature_engineering already repeats on every redemption row
+MEMBER_LEVEL_COLUMNS = [
+    'total_redemptions', 'total_points_redeemed', 'avg_points_redeemed', 'std_points_redeemed',
+    'max_points_redeemed', 'total_value_usd', 'avg_value_usd', 'account_age_days',
+    'shared_ip_count', 'shared_device_count'
+]
+
+# Hour-of-day buckets used for the time-of-day mix
+TIME_OF_DAY_BINS = [0, 6, 12, 18, 24]
+TIME_OF_DAY_LABELS = ['night', 'morning', 'afternoon', 'evening']
+
+
+def build_member_vectors(df):
+    """
+    Collapse redemption-level engineered features into one behavioral vector per member:
+    velocity, value, time-of-day mix and channel/category mix.
+    Returns (member_ids, feature_names, matrix).
+    """
+    grouped = df.groupby('member_id', sort=True)
+
+    member_df = grouped[MEMBER_LEVEL_COLUMNS].first()
+
+    # Velocity: typical gap between redemptions (first redemption is encoded as -1)
+    gaps = df['time_since_last_redemption_h'].where(df['time_since_last_redemption_h'] >= 0)
+    member_df['median_gap_h'] = gaps.groupby(df['member_id']).median().fillna(-1)
+    member_df['weekend_share'] = grouped['is_weekend'].mean()
+
+    # Time-of-day mix
+    buckets = pd.cut(df['hour_of_day'], bins=TIME_OF_DAY_BINS, labels=TIME_OF_DAY_LABELS, right=False)
+    tod_mix = pd.crosstab(df['member_id'], buckets, normalize='index')
+    tod_mix.columns = [f'tod_{c}_share' for c in tod_mix.columns]
+    member_df = member_df.join(tod_mix)
+
+    # Channel / category mix from the one-hot columns
+    mix_cols = [c for c in df.columns if c.startswith('category_') or c.startswith('channel_')]
+    if mix_cols:
+        mix = df[mix_cols].astype(float).groupby(df['member_id']).mean()
+        mix.columns = [f'{c}_share' for c in mix.columns]
+        member_df = member_df.join(mix)
+
+    member_df = member_df.fillna(0)
+    return member_df.index.to_numpy(), list(member_df.columns), member_df.to_numpy(dtype=np.float32)
+
+
+class MemberSimilarityIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbor index over standardized member vectors.
+
+    Vectors are partitioned into `n_lists` k-means cells and stored contiguously per cell.
+    A query only scans the `n_probe` cells whose centroids are closest to it, so search
+    cost is roughly n_probe / n_lists of an exact scan.
+    """
+
+    def __init__(self, n_lists=None, n_probe=16, random_state=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def fit(self, member_ids, feature_names, X):
+        self.feature_names = feature_names
+        self.mean_ = X.mean(axis=0)
+        self.scale_ = X.std(axis=0)
+        self.scale_[self.scale_ == 0] = 1.0
+        Z = ((X - self.mean_) / self.scale_).astype(np.float32)
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(Z))))
+        n_lists = min(n_lists, len(Z))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=3, random_state=self.random_state)
+        assignments = kmeans.fit_predict(Z)
+        self.centroids_ = kmeans.cluster_centers_.astype(np.float32)
+
+        # Store vectors grouped by cell so each probe is a contiguous slice
+        order = np.argsort(assignments, kind='stable')
+        self.vectors_ = Z[order]
+        self.norms_ = np.einsum('ij,ij->i', self.vectors_, self.vectors_)
+        self.member_ids_ = np.asarray(member_ids)[order]
+        self.list_offsets_ = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        self.position_ = pd.Series(np.arange(len(order)), index=self.member_ids_)
+        return self
+
+    def _vectors_for(self, member_ids):
+        positions = self.position_.reindex(member_ids)
+        missing = positions[positions.isna()].index.tolist()
+        if missing:
+            raise KeyError(f"Unknown member_id(s): {missing[:10]}")
+        return self.vectors_[positions.to_numpy(dtype=int)]
+
+    def _search_one(self, q, k, exclude_id, n_probe):
+        centroid_dist = ((self.centroids_ - q) ** 2).sum(axis=1)
+        n_probe = min(n_probe, len(self.centroids_))
+        probe = np.argpartition(centroid_dist, n_probe - 1)[:n_probe]
+
+        candidates = np.concatenate([
+            np.arange(self.list_offsets_[c], self.list_offsets_[c + 1]) for c in probe
+        ])
+        # ||v - q||^2 up to the constant ||q||^2
+        dist = self.norms_[candidates] - 2 * self.vectors_[candidates] @ q
+        if exclude_id is not None:
+            dist[self.member_ids_[candidates] == exclude_id] = np.inf
+
+        top = min(k, len(candidates))
+        best = np.argpartition(dist, top - 1)[:top]
+        best = best[np.argsort(dist[best])]
+        best = best[np.isfinite(dist[best])]
+
+        sq_dist = np.maximum(dist[best] + q @ q, 0)
+        return self.member_ids_[candidates[best]], np.sqrt(sq_dist)
+
+    def query(self, member_ids, k=10, n_probe=None):
+        """
+        Return the top-k most similar members for each member_id in `member_ids`
+        as a DataFrame of (member_id, similar_member_id, rank, distance).
+        """
+        member_ids = np.atleast_1d(member_ids)
+        n_probe = n_probe or self.n_probe
+        Q = self._vectors_for(member_ids)
+
+        rows = []
+        for member_id, q in zip(member_ids, Q):
+            ids, dists = self._search_one(q, k, member_id, n_probe)
+            for rank, (sim_id, dist) in enumerate(zip(ids, dists), start=1):
+                rows.append((member_id, sim_id, rank, float(dist)))
+        return pd.DataFrame(rows, columns=['member_id', 'similar_member_id', 'rank', 'distance'])
+
+    def exact_query(self, member_ids, k=10, max_chunk_cells=16_000_000):
+        """
+        Brute-force top-k over all members, used as ground truth for recall.
+        Queries are processed in chunks so the distance matrix stays under
+        `max_chunk_cells` entries (~64 MB of float32) however many members are indexed.
+        """
+        member_ids = np.atleast_1d(member_ids)
+        Q = self._vectors_for(member_ids)
+        positions = self.position_.reindex(member_ids).to_numpy(dtype=int)
+
+        n = len(self.vectors_)
+        # Every member except the query itself is a candidate
+        k = min(k, n - 1)
+        if k <= 0:
+            return [np.array([], dtype=self.member_ids_.dtype) for _ in member_ids]
+        chunk_size = max(1, max_chunk_cells // n)
+
+        results = []
+        for start in range(0, len(Q), chunk_size):
+            chunk = Q[start:start + chunk_size]
+            dist = self.norms_[None, :] - 2 * chunk @ self.vectors_.T
+            dist[np.arange(len(chunk)), positions[start:start + chunk_size]] = np.inf
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            for row, idx in zip(dist, top):
+                results.append(self.member_ids_[idx[np.argsort(row[idx])]])
+        return results
+
+    def evaluate_recall(self, k=10, sample_size=500, n_probe=None):
+        """Recall@k of the approximate search against exact search on a random sample of members."""
+        rng = np.random.default_rng(self.random_state)
+        sample = rng.choice(self.member_ids_, size=min(sample_size, len(self.member_ids_)), replace=False)
+
+        start = time.perf_counter()
+        approx = self.query(sample, k=k, n_probe=n_probe)
+        approx_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+        exact = self.exact_query(sample, k=k)
+        approx_sets = approx.groupby('member_id')['similar_member_id'].apply(set)
+
+        hits = sum(len(approx_sets.get(m, set()) & set(truth)) for m, truth in zip(sample, exact))
+        total = sum(len(truth) for truth in exact)
+        return {'recall_at_k': hits / total if total else 0.0, 'k': k, 'avg_query_ms': approx_ms}
+
+
+def build_similarity_index(df=None, path=INDEX_PATH):
+    """Build the member similarity index from engineered features and persist it."""
+    if df is None:
+        df = pd.read_csv('data/engineered_features.csv')
+
+    print("Building member behavior vectors...")
+    member_ids, feature_names, X = build_member_vectors(df)
+
+    print(f"Indexing {len(member_ids):,} members across {len(feature_names)} dimensions...")
+    index = MemberSimilarityIndex().fit(member_ids, feature_names, X)
+
+    stats = index.evaluate_recall()
+    print(f"Similarity index Recall@{stats['k']}: {stats['recall_at_k']:.2%} "
+          f"({stats['avg_query_ms']:.2f} ms/query)")
+
+    joblib.dump(index, path)
+    print(f"Similarity index saved to {path}")
+    return index
+
+
+@lru_cache(maxsize=2)
+def _load_index(path, mtime):
+    # Keyed on mtime so a rebuilt index file is picked up without restarting the process
+    return joblib.load(path)
+
+
+def find_similar_members(member_ids, k=10, path=INDEX_PATH):
+    """Return the top-k similar members for one or more member ids from the persisted index."""
+    index = _load_index(path, os.path.getmtime(path))
+    return index.query(member_ids, k=k)
+
+
+if __name__ == "__main__":
+    build_similarity_index()
@@ -0,0 +1,192 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CURVE_PATH = 'data/metrics/threshold_curve.csv'
+OPERATING_POINTS_PATH = 'data/metrics/operating_points.json'
+
+# Served curve resolution; the dashboard slider snaps to this grid
+GRID = np.round(np.linspace(0, 1, 1001), 3)
+
+DEFAULT_THRESHOLD = 0.8
+
+# Holdout rows are tagged 'validation' (threshold selection) or 'evaluation' (served curve)
+SPLIT_COLUMN = 'threshold_split'
+
+
+def threshold_curve(y_true, scores, amounts, thresholds=None, n_days=730, sample_fraction=1.0):
+    """
+    Confusion-matrix metrics at every candidate threshold (alert when score >= threshold).
+
+    Scores are sorted once; cumulative sums over that order give true/false positives and
+    dollars caught for the top-k alerts, and each threshold maps to its k with a binary
+    search. With thresholds=None every distinct score is a candidate. O(n log n) overall.
+    """
+    y_true = np.asarray(y_true, dtype=int)
+    scores = np.asarray(scores, dtype=float)
+    amounts = np.asarray(amounts, dtype=float)
+
+    order = np.argsort(-scores, kind='mergesort')
+    sorted_desc = scores[order]
+    y_sorted = y_true[order]
+
+    # Index 0 means "no alerts"
+    tp = np.concatenate([[0], np.cumsum(y_sorted)])
+    fp = np.concatenate([[0], np.cumsum(1 - y_sorted)])
+    caught = np.concatenate([[0.0], np.cumsum(amounts[order] * y_sorted)])
+
+    if thresholds is None:
+        thresholds = np.unique(scores)
+    thresholds = np.asarray(thresholds, dtype=float)
+    # Number of scores >= t, found on the ascending negated scores
+    k = np.searchsorted(-sorted_desc, -thresholds, side='right')
+
+    positives, negatives = tp[-1], fp[-1]
+    total_exposure = caught[-1]
+    tp_k, fp_k = tp[k], fp[k]
+    volume = tp_k + fp_k
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        curve = pd.DataFrame({
+            'threshold': thresholds,
+            'recall': np.where(positives > 0, tp_k / positives, 0.0),
+            'precision': np.where(volume > 0, tp_k / volume, 1.0),
+            'fpr': np.where(negatives > 0, fp_k / negatives, 0.0),
+            'alert_volume': volume,
+            'alerts_per_day': volume / (sample_fraction * n_days),
+            'exposure_caught_usd': caught[k],
+            'exposure_caught_pct': np.where(total_exposure > 0, caught[k] / total_exposure, 0.0),
+            # Raw counts let curves for disjoint fraud types be combined downstream
+            'true_positives': tp_k,
+            'false_positives': fp_k,
+            'positives': positives,
+            'negatives': negatives,
+            'total_exposure_usd': total_exposure,
+        })
+    return curve
+
+def choose_operating_point(curve, max_fpr=0.05, max_alerts_per_day=None, min_precision=None):
+    """Pick the threshold that catches the most fraud dollars while meeting every constraint."""
+    feasible = curve['fpr'] <= max_fpr
+    if max_alerts_per_day is not None:
+        feasible &= curve['alerts_per_day'] <= max_alerts_per_day
+    if min_precision is not None:
+        feasible &= curve['precision'] >= min_precision
+
+    candidates = curve[feasible]
+    if candidates.empty:
+        return None
+    # Highest dollars caught, then highest recall, then highest threshold
+    best = candidates.sort_values(['exposure_caught_usd', 'recall', 'threshold'], ascending=False).iloc[0]
+    return best.to_dict()
+
+def _segments(df):
+    # Per-type segments compare that type's fraud against legitimate redemptions only
+    segments = {'all': df}
+    for fraud_type in sorted(df.loc[df['is_fraud'] == 1, 'fraud_type'].dropna().unique()):
+        if fraud_type != 'none':
+            segments[fraud_type] = df[(df['is_fraud'] == 0) | (df['fraud_type'] == fraud_type)]
+    return segments
+
+def optimize_thresholds(df, max_fpr=0.05, max_alerts_per_day=None, min_precision=None, n_days=730,
+                        population_rows=None, curve_df=None):
+    """
+    Choose overall and per-fraud-type operating points on scored rows `df` (is_fraud,
+    fraud_type, fraud_prob, amount_usd) and build the served curves from `curve_df`
+    (default: `df`). Passing disjoint rows keeps the served metrics out of sample.
+    """
+    curve_df = df if curve_df is None else curve_df
+    population_rows = population_rows or len(df)
+
+    points = {}
+    for name, seg in _segments(df).items():
+        exact = threshold_curve(seg['is_fraud'], seg['fraud_prob'], seg['amount_usd'],
+                                n_days=n_days, sample_fraction=len(df) / population_rows)
+        points[name] = choose_operating_point(exact, max_fpr, max_alerts_per_day, min_precision)
+
+    curves = []
+    for name, seg in _segments(curve_df).items():
+        served = threshold_curve(seg['is_fraud'], seg['fraud_prob'], seg['amount_usd'], thresholds=GRID,
+                                 n_days=n_days, sample_fraction=len(curve_df) / population_rows)
+        served.insert(0, 'fraud_type', name)
+        curves.append(served)
+
+    return pd.concat(curves, ignore_index=True), points
+
+def save_thresholds(curve, points, scale, curve_path=CURVE_PATH, points_path=OPERATING_POINTS_PATH):
+    """Persist the served curve plus operating points and the volume scale they were computed with."""
+    os.makedirs(os.path.dirname(curve_path), exist_ok=True)
+    curve.to_csv(curve_path, index=False)
+    with open(points_path, 'w') as f:
+        json.dump({'scale': scale, 'operating_points': points}, f)
+
+def load_operating_points(path=OPERATING_POINTS_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def load_alert_threshold(fraud_type='all', path=OPERATING_POINTS_PATH):
+    """Threshold of the chosen operating point, falling back to the legacy 0.8 cutoff."""
+    point = load_operating_points(path).get('operating_points', {}).get(fraud_type)
+    return point['threshold'] if point else DEFAULT_THRESHOLD
+
+def _observed_days(df):
+    if 'timestamp' not in df:
+        return None
+    timestamps = pd.to_datetime(df['timestamp'])
+    return (timestamps.max() - timestamps.min()).days + 1
+
+def run_threshold_optimization(df=None, max_fpr=0.05, max_alerts_per_day=None, population_rows=None, n_days=None):
+    """
+    Optimize thresholds on scored rows `df`, a sample of `population_rows` redemptions
+    spanning `n_days`. Alert volumes are scaled by sample size / population_rows so
+    alerts_per_day reflects full traffic whichever sample is passed in. When not given,
+    the scale stored by the previous run (i.e. the training pipeline) is reused.
+    Rows tagged in SPLIT_COLUMN pick operating points on the validation rows and serve
+    the curve from the evaluation rows.
+    """
+    if df is None:
+        df = pd.read_csv('data/model_test_results.csv')
+
+    if SPLIT_COLUMN in df:
+        select_df = df[df[SPLIT_COLUMN] == 'validation']
+        curve_df = df[df[SPLIT_COLUMN] == 'evaluation']
+    else:
+        print("No validation/evaluation split recorded; the served curve is in-sample.")
+        select_df = curve_df = df
+
+    stored = load_operating_points().get('scale', {})
+    population_rows = population_rows or stored.get('population_rows')
+    n_days = n_days or stored.get('n_days') or _observed_days(df)
+    if population_rows is None or n_days is None:
+        print("No population size recorded; treating the scored rows as full traffic.")
+        population_rows = population_rows or len(df)
+        n_days = n_days or 1
+    scale = {'population_rows': int(population_rows), 'n_days': int(n_days)}
+
+    print("Optimizing alert thresholds...")
+    curve, points = optimize_thresholds(select_df, max_fpr=max_fpr, max_alerts_per_day=max_alerts_per_day,
+                                        n_days=n_days, population_rows=population_rows, curve_df=curve_df)
+
+    constraint = f"FPR <= {max_fpr:.0%}"
+    if max_alerts_per_day is not None:
+        constraint += f", <= {max_alerts_per_day:,.0f} alerts/day"
+    print(f"Operating points ({constraint}):")
+    for name, point in points.items():
+        if point is None:
+            print(f"  {name.title()}: no threshold meets the constraints")
+        else:
+            print(f"  {name.title()}: threshold {point['threshold']:.3f} | recall {point['recall']:.2%} | "
+                  f"precision {point['precision']:.2%} | FPR {point['fpr']:.2%} | "
+                  f"${point['exposure_caught_usd']:,.0f} caught")
+
+    save_thresholds(curve, points, scale)
+    print(f"Threshold curve saved to {CURVE_PATH}")
+    return curve, points
+
+if __name__ == "__main__":
+    run_threshold_optimization()